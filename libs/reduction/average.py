@@ -1,13 +1,16 @@
+import os
 import shutil
-from typing import List
+from typing import List, Tuple
 from pathlib import Path
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # TODO: Find way to make this into a complete module -> More pythonic!
+from plot import plot_fits_files
 from readout import ReadoutFits
 from calib_BCD2 import calib_BCD
 from avg_oifits import avg_oifits
-from utils import cprint, split_fits
+from utils import cprint, split_fits, get_fits_by_tag
 
 
 HEADER_TO_REMOVE = [{'key':'HIERARCH ESO INS BCD1 ID','value':' '},
@@ -16,6 +19,31 @@ HEADER_TO_REMOVE = [{'key':'HIERARCH ESO INS BCD1 ID','value':' '},
                     {'key':'HIERARCH ESO INS BCD2 NAME','value':' '}]
 
 
+def _fast_copy(source: Path, destination: Path) -> None:
+    """Copies a file in the kernel via 'os.copy_file_range', which lets reflink-capable
+    filesystems share the data blocks instead of copying them. Falls back to
+    'shutil.copyfile' where this is not supported
+
+    Parameters
+    ----------
+    source: Path
+    destination: Path
+    """
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            bytes_left = os.fstat(src.fileno()).st_size
+            while bytes_left > 0:
+                bytes_copied = os.copy_file_range(src.fileno(), dst.fileno(), bytes_left)
+                # NOTE: Some filesystems do not support it and copy nothing, without
+                # raising. This falls back to the full copy instead of truncating
+                if bytes_copied == 0:
+                    raise OSError("'os.copy_file_range' copied no data")
+                bytes_left -= bytes_copied
+    except (AttributeError, OSError):
+        shutil.copyfile(source, destination)
+    shutil.copymode(source, destination)
+
+
 def sort_fits_by_BCD(fits_files: List[Path]) -> namedtuple:
     """Sorts the input (.fits)-files by their BCD configuration
 
@@ -79,50 +107,77 @@ def bcd_calibration(unchopped_fits: List[Path], output_dir: Path):
     # TODO: See how to bcd-calibrate the chopped files as well
 
 
+def average_folder(folder: Path, root_dir: Path, mode: str) -> List[Tuple[Path, Path]]:
+    """Averages and BCD-calibrates the files of a single folder
+
+    Parameters
+    ----------
+    folder: Path
+        The folder containing the calibrated data
+    root_dir: Path
+        The root folder for the PRODUCT
+    mode: str
+        The mode of the reduction, either "coherent" or "incoherent"
+
+    Returns
+    -------
+    plot_tasks: List[Tuple[Path, Path]]
+        The averaged (.fits)-files and the paths their plots are saved to
+    """
+    cprint(f"Averaging folder {folder.name}...", "g")
+    cprint(f"{'':-^50}", "lg")
+
+    # TODO: Make check if vis-calibration or flux calibration did not work
+    fits_files = list(folder.glob("*.fits"))
+    unchopped_vis_fits, chopped_vis_fits = split_fits(folder, "TARGET_CAL",
+                                                      fits_files)
+    unchopped_flux_fits, chopped_flux_fits = split_fits(folder, "TARGET_FLUXCAL",
+                                                        fits_files)
+
+    folder_split = folder.name.split(".")
+    folder_split[0] += "-AVG"
+    new_folder = ".".join(folder_split)
+    output_dir = root_dir / "bcd_and_averaged" / mode / new_folder
+
+    if not output_dir.exists():
+        output_dir.mkdir(parents=True)
+
+    average_files(unchopped_vis_fits, chopped_vis_fits, output_dir)
+    average_files(unchopped_flux_fits, chopped_flux_fits, output_dir)
+    bcd_calibration(unchopped_vis_fits, output_dir)
+    for fits_file in fits_files:
+        _fast_copy(fits_file, output_dir / fits_file.name)
+
+    cprint(f"{'':-^50}", "lg")
+    return [(fits_file, output_dir) for fits_file in get_fits_by_tag(output_dir, "AVG")]
+
+
 def average_folders(root_dir: Path, mode: str) -> None:
         """Calls Jozsef's code and does a average over the files for one band to average
-        the reduced and calibrated data
+        the reduced and calibrated data. The folders are averaged in parallel
 
         Parameters
         ----------
         root_dir: Path
             The root folder for the PRODUCT
-        band_dir: Path
-            The folder in which the calibrated data is contained
+        mode: str
+            The mode of the reduction, either "coherent" or "incoherent"
         """
         mode_dir = Path("calib", mode)
-        folders = (root_dir / mode_dir).glob("*.rb")
-
-        for folder in folders:
-            # TODO: Make this into function
-            cprint(f"Averaging folder {folder.name}...", "g")
-            cprint(f"{'':-^50}", "lg")
-
-            # TODO: Make check if vis-calibration or flux calibration did not work
-            unchopped_vis_fits, chopped_vis_fits = split_fits(folder,
-                                                              "TARGET_CAL")
-            unchopped_flux_fits, chopped_flux_fits = split_fits(folder,
-                                                                "TARGET_FLUXCAL")
-
-            folder_split = folder.name.split(".")
-            folder_split[0] += "-AVG"
-            new_folder = ".".join(folder_split)
-            output_dir = root_dir / "bcd_and_averaged" / mode / new_folder
-
-            if not output_dir.exists():
-                output_dir.mkdir(parents=True)
-
-            average_files(unchopped_vis_fits, chopped_vis_fits, output_dir)
-            average_files(unchopped_flux_fits, chopped_flux_fits, output_dir)
-            bcd_calibration(unchopped_vis_fits, output_dir)
-            for fits_file in folder.glob("*.fits"):
-                shutil.copy(str(fits_file), (output_dir / fits_file.name))
-
-            cprint("Plotting averaged files...", "g")
-            for fits_file in get_fits_by_tag(output_dir, "AVG"):
-                plot_fits = Plotter([fits_file], save_path=output_dir)
-                plot_fits.add_cphase().add_vis().plot(save=True)
-            cprint(f"{'':-^50}", "lg")
+        folders = list((root_dir / mode_dir).glob("*.rb"))
+        if not folders:
+            return
+
+        plot_tasks = []
+        max_workers = min(len(folders), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(average_folder, folder, root_dir, mode)
+                       for folder in folders]
+            for future in as_completed(futures):
+                plot_tasks.extend(future.result())
+
+        cprint("Plotting averaged files...", "g")
+        plot_fits_files(plot_tasks)
 
 
 def average(data_path: Path, stem_dir: Path, target_dir: Path):
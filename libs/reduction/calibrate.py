@@ -1,15 +1,17 @@
+import os
 import shutil
 import subprocess
 from pathlib import Path
 from typing import List, Optional
-from collections import deque, namedtuple
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # TODO: Find way to make this into a complete module -> More pythonic!
-from plot import Plotter
+from plot import plot_fits_files
 from readout import ReadoutFits
 from fluxcal import fluxcal
 from calib_BCD2 import calib_BCD
-from utils import get_path_descriptor, check_if_target, cprint, get_fits_by_tag
+from utils import get_path_descriptor, cprint, get_fits_by_tag
 
 
 # TODO: Also make the CAL-CAL calibration??
@@ -22,6 +24,27 @@ LBAND_DATABASES = [DATABASE_DIR / database\
 NBAND_DATABASES = LBAND_DATABASES[:]+[DATABASE_DIR / "vBoekelDatabase.fitsold"]
 
 ESOREX_CMD = "/data/beegfs/astro-storage/groups/matisse/isbell/esorex_installation/bin/esorex"
+SEPARATOR = f"{'':-^50}"
+
+
+def _list_sorted(dir_path: Path, prefix: str) -> List[Path]:
+    """Lists the files in a directory starting with the prefix, sorted by the last
+    eight characters of their names
+
+    Parameters
+    ----------
+    dir_path: Path
+    prefix: str
+
+    Returns
+    -------
+    files: List[Path]
+    """
+    with os.scandir(dir_path) as entries:
+        names = [entry.name for entry in entries
+                 if entry.is_file() and entry.name.startswith(prefix)]
+    names.sort(key=lambda name: name[-8:])
+    return [dir_path / name for name in names]
 
 
 # TODO: Make functionality that does not only calibrate willy nilly, but checks if the
@@ -44,7 +67,11 @@ def create_visbility_sof(raw_dir: Path,
 
 # TODO: Implement visibility calibration like Jozsef, maybe?
 def calibrate_fits_files(root_dir: Path, tar_dir: Path,
-                         cal_dir: Path, mode_name: str) -> None:
+                         cal_dir: Path, mode_name: str,
+                         targets: Optional[List[Path]] = None,
+                         calibrators: Optional[List[Path]] = None,
+                         overwrite: Optional[bool] = True,
+                         max_workers: Optional[int] = 1) -> None:
     """The calibration for a target and a calibrator folder
 
     Parameters
@@ -56,6 +83,18 @@ def calibrate_fits_files(root_dir: Path, tar_dir: Path,
     mode: str
         The mode of calibration. Either "corrflux", "flux" or "both" depending
         if it is "coherent" or "incoherent" reduced data
+    targets: List[Path], optional
+        The already listed 'TARGET_RAW_INT'-files of the "tar_dir". If not given, the
+        "tar_dir" is searched for them
+    calibrators: List[Path], optional
+        The already listed 'CALIB_RAW_INT'-files of the "cal_dir". If not given, the
+        "cal_dir" is searched for them
+    overwrite: bool, optional
+        If toggled, the flux calibration is redone even if its output exists already.
+        Default is toggled
+    max_workers: int, optional
+        The number of processes the target-calibrator pairs are flux calibrated in.
+        Default is a single one, i.e., serial calibration
 
     See Also
     --------
@@ -63,22 +102,22 @@ def calibrate_fits_files(root_dir: Path, tar_dir: Path,
     """
     # TODO: Make the following into a function
     cprint(f"Calibrating {tar_dir.name} with {cal_dir.name}...", "p")
-    targets = sorted(tar_dir.glob("TARGET_RAW_INT*"),
-                     key=lambda x: x.name[-8:])
+    if targets is None:
+        targets = _list_sorted(tar_dir, "TARGET_RAW_INT")
 
     if not targets:
         cprint("No 'TARGET_RAW_INT*'-files found. SKIPPED!", "y")
-        cprint(f"{'':-^50}", "lg")
+        cprint(SEPARATOR, "lg")
         return
 
-    calibrators = sorted(cal_dir.glob("CALIB_RAW_INT*"),
-                         key=lambda x: x.name[-8:])
+    if calibrators is None:
+        calibrators = _list_sorted(cal_dir, "CALIB_RAW_INT")
 
     # TODO: Make this better so it calibrates even if the calibrator or the science
     # target is chopped but the other is not
     if len(targets) != len(calibrators):
         cprint("#'TARGET_RAW_INT'-files != #'CALIB_RAW_INT'-files. SKIPPING!", "y")
-        cprint(f"{'':-^50}", "lg")
+        cprint(SEPARATOR, "lg")
         return
 
     output_dir = get_path_descriptor(root_dir, "TAR-CAL", targets[0], calibrators[0])
@@ -87,49 +126,70 @@ def calibrate_fits_files(root_dir: Path, tar_dir: Path,
         output_dir.mkdir(parents=True)
 
     # TODO: Make the following into a function
-    cprint(f"{'':-^50}", "lg")
+    cprint(SEPARATOR, "lg")
     cprint("Calibrating fluxes...", "g")
+    flux_tasks = []
     for index, (target, calibrator) in enumerate(zip(targets, calibrators), start=1):
-        cprint(f"{'':-^50}", "lg")
-        cprint(f"Processing {target.name} with {calibrator.name}...", "g")
-        output_file = str(output_dir / f"TARGET_FLUXCAL_INT_000{index}.fits")
-        target, calibrator = str(target), str(calibrator)
-
-        # TODO: Make this not as redundant, and the airmass correction implement as well?
-        if "lband" in target:
-            fluxcal(target, calibrator, output_file,
-                    list(map(str, LBAND_DATABASES)), mode=mode_name,
-                    output_fig_dir=str(output_dir), do_airmass_correction=True)
-        else:
-            fluxcal(target, calibrator, output_file,
-                    list(map(str, NBAND_DATABASES)), mode=mode_name,
-                    output_fig_dir=str(output_dir), do_airmass_correction=True)
-        cprint("Plotting file...", "y")
-    plot_fits = Plotter([output_file], save_path=output_dir)
-    plot_fits.add_cphase().add_vis().plot(save=True)
-
-    cprint(f"{'':-^50}", "lg")
+        output_file = output_dir / f"TARGET_FLUXCAL_INT_000{index}.fits"
+        if output_file.exists() and not overwrite:
+            cprint(f"Skipping {output_file.name}, already exists", "y")
+            continue
+        # TODO: Make the airmass correction implement as well?
+        databases = LBAND_DATABASES if "lband" in str(target) else NBAND_DATABASES
+        # NOTE: Each pair gets its own figure directory, so that pairs calibrated in
+        # parallel do not overwrite each other's figures
+        fig_dir = output_dir / output_file.stem
+        fig_dir.mkdir(exist_ok=True)
+        flux_tasks.append((target, calibrator, str(output_file),
+                           list(map(str, databases)), str(fig_dir)))
+
+    # NOTE: The target-calibrator pairs are independent and can be calibrated in parallel
+    if max_workers > 1 and len(flux_tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fluxcal, str(target), str(calibrator), output_file,
+                                       databases, mode=mode_name, output_fig_dir=fig_dir,
+                                       do_airmass_correction=True): (target, calibrator)
+                       for target, calibrator, output_file, databases, fig_dir in flux_tasks}
+            for future in as_completed(futures):
+                future.result()
+                target, calibrator = futures[future]
+                cprint(SEPARATOR, "lg")
+                cprint(f"Processed {target.name} with {calibrator.name}...", "g")
+    else:
+        for target, calibrator, output_file, databases, fig_dir in flux_tasks:
+            cprint(SEPARATOR, "lg")
+            cprint(f"Processing {target.name} with {calibrator.name}...", "g")
+            fluxcal(str(target), str(calibrator), output_file, databases,
+                    mode=mode_name, output_fig_dir=fig_dir, do_airmass_correction=True)
+    cprint("Plotting files...", "y")
+    plot_fits_files([(fits_file, output_dir)
+                     for fits_file in get_fits_by_tag(output_dir, "TARGET_FLUXCAL_INT")])
+
+    cprint(SEPARATOR, "lg")
     cprint("Calibrating visibilities...", "g")
     sof_file = create_visbility_sof(output_dir, targets, calibrators)
     subprocess.call([ESOREX_CMD, f"--output-dir={str(output_dir)}",
                      "mat_cal_oifits", str(sof_file)],
                     stdout=subprocess.DEVNULL)
     cprint("Plotting visibility files...", "g")
-    for fits_file in get_fits_by_tag(output_dir, "TARGET_CAL_INT"):
-        plot_fits = Plotter([fits_file], save_path=output_dir)
-        plot_fits.add_cphase().add_vis().plot(save=True)
+    plot_fits_files([(fits_file, output_dir)
+                     for fits_file in get_fits_by_tag(output_dir, "TARGET_CAL_INT")])
 
     # TODO: Find way to make this moving better than this -> Moves (.fits)-files
     # from this path that get created by 'mat_cal_oifits?'
-    for fits_file in Path().cwd().glob("*.fits"):
-        shutil.move(str(fits_file), str(output_dir / fits_file.name))
+    with os.scandir(Path().cwd()) as entries:
+        fits_files = [entry.name for entry in entries if entry.name.endswith(".fits")]
+    for fits_file in fits_files:
+        shutil.move(fits_file, str(output_dir / fits_file))
     shutil.move(str(Path().cwd() / "esorex.log"),
                 str(output_dir / "mat_cal_oifits.log"))
-    cprint(f"{'':-^50}", "lg")
+    cprint(SEPARATOR, "lg")
 
 
 def calibrate_folders(root_dir: Path, band_dir: Path,
-                      mode_name: Optional[str] = "corrflux") -> None:
+                      mode_name: Optional[str] = "corrflux",
+                      overwrite: Optional[bool] = True,
+                      max_workers: Optional[int] = 1) -> None:
     """Takes two folders and calibrates their contents together
 
     Parameters
@@ -140,25 +200,49 @@ def calibrate_folders(root_dir: Path, band_dir: Path,
     mode: str, optional
         The mode of calibration. Either "corrflux", "flux" or "both" depending
         if it is "coherent" or "incoherent". Default mode is "corrflux"
+    overwrite: bool, optional
+        If toggled, already existing flux calibrated files are redone. Default is
+        toggled
+    max_workers: int, optional
+        The number of processes the flux calibration of each folder pair runs in
     """
-    sub_dirs = sorted((root_dir / band_dir).glob("*.rb"))
-    sub_dirs_rotated = deque(sub_dirs.copy())
-    sub_dirs_rotated.rotate(1)
+    if not (root_dir / band_dir).is_dir():
+        return
+    with os.scandir(root_dir / band_dir) as entries:
+        sub_dirs = sorted(Path(entry.path) for entry in entries
+                          if entry.name.endswith(".rb") and entry.is_dir())
+
+    # NOTE: Every directory is listed once, instead of once per target-calibrator pair
+    targets = {directory: _list_sorted(directory, "TARGET_RAW_INT")
+               for directory in sub_dirs}
+    calibrators = {directory: _list_sorted(directory, "CALIB_RAW_INT")
+                   for directory in sub_dirs}
 
     for directory in sub_dirs:
         cprint(f"Calibration of {directory.name} with mode_name={mode_name}", "lp")
-        cprint(f"{'':-^50}", "lg")
-        if check_if_target(directory):
-            for dir_rotated in sub_dirs_rotated:
+        cprint(SEPARATOR, "lg")
+        if targets[directory]:
+            # NOTE: Only directories with as many calibrator as target files can be
+            # used for the calibration, the others are skipped without being entered
+            cal_dirs = [cal_dir for cal_dir in sub_dirs
+                        if len(calibrators[cal_dir]) == len(targets[directory])]
+            if len(cal_dirs) < len(sub_dirs):
+                cprint(f"Skipping {len(sub_dirs)-len(cal_dirs)} directories with"
+                       " #'CALIB_RAW_INT'-files != #'TARGET_RAW_INT'-files", "y")
+            for cal_dir in cal_dirs:
                 calibrate_fits_files(root_dir, directory,
-                                     dir_rotated, mode_name=mode_name)
+                                     cal_dir, mode_name=mode_name,
+                                     targets=targets[directory],
+                                     calibrators=calibrators[cal_dir],
+                                     overwrite=overwrite, max_workers=max_workers)
         else:
             cprint("No 'TARGET_RAW_INT*'-files found. SKIPPED!", "y")
-            cprint(f"{'':-^50}", "lg")
-            continue
+            cprint(SEPARATOR, "lg")
 
 
-def calibrate(data_dir: Path, stem_dir: Path, target_dir: Path):
+def calibrate(data_dir: Path, stem_dir: Path, target_dir: Path,
+              overwrite: Optional[bool] = True,
+              max_workers: Optional[int] = 1):
     """Does the full calibration for all of the "cal_dir" subdirectories
 
     Parameters
@@ -166,13 +250,20 @@ def calibrate(data_dir: Path, stem_dir: Path, target_dir: Path):
     data_dir: Path
     stem_dir: Path
     target_dir: Path
+    overwrite: bool, optional
+        If toggled, already existing flux calibrated files are redone. Default is
+        toggled
+    max_workers: int, optional
+        The number of processes the flux calibration of each folder pair runs in
     """
     root_dir = Path(data_dir, stem_dir, "products", target_dir)
     modes, bands = {"coherent": "corrflux", "incoherent": "flux"}, ["lband", "nband"]
 
     for mode, mode_name in modes.items():
         for band in bands:
-            calibrate_folders(root_dir, Path(mode, band), mode_name=mode_name)
+            calibrate_folders(root_dir, Path(mode, band),
+                              mode_name=mode_name, overwrite=overwrite,
+                              max_workers=max_workers)
     cprint("Calibration Done!", "lp")
 
 
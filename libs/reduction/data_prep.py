@@ -1,4 +1,5 @@
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Optional, List
 
 import numpy as np
@@ -38,8 +39,7 @@ class DataPrep:
         self._oi_wl = None
         self._oi_flux, self._oi_t3 = None, None
         self._oi_vis, self._oi_vis2 = None, None
-
-        self.readouts = [ReadoutFits(fits_file) for fits_file in self.fits_files]
+        self._readouts = None
 
         # TODO: Implement this in plotter
         # self.uv_coords = self._merge_simple_data("uvcoords")
@@ -57,6 +57,19 @@ class DataPrep:
         """The DataHandler class' string representation"""
         return self.__repr__()
 
+    @property
+    def readouts(self) -> List[ReadoutFits]:
+        """The readouts of the (.fits)-files. Only created when first accessed"""
+        if self._readouts is None:
+            if len(self.fits_files) > 1:
+                # NOTE: Opening the files is I/O-bound, thus overlapped in threads
+                with ThreadPoolExecutor(max_workers=min(16, len(self.fits_files)))\
+                        as executor:
+                    self._readouts = list(executor.map(ReadoutFits, self.fits_files))
+            else:
+                self._readouts = [ReadoutFits(fits_file) for fits_file in self.fits_files]
+        return self._readouts
+
     @property
     def longest_entry(self):
         """The longest entry of all the rows. Fetched from the 'oi_wl'-tables"""
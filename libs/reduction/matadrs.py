@@ -2,7 +2,9 @@ import os
 import time
 import datetime
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from typing import Optional, List
 
 from .libs.reduction.reduce import reduce
@@ -12,6 +14,62 @@ from .libs.reduction.merge import merge
 from .libs.reduction.utils import cprint
 
 
+def process_epoch(data_dir: Path, stem_dir: Path, target_dir: Path,
+                  do_reduce: Optional[bool] = True,
+                  do_calibrate: Optional[bool] = True,
+                  do_average: Optional[bool] = True,
+                  do_merge: Optional[bool] = True,
+                  overwrite: Optional[bool] = True,
+                  in_work_dir: Optional[bool] = False) -> None:
+    """Reduces, calibrates, averages and merges a single epoch
+
+    Parameters
+    ----------
+    data_dir: Path
+    stem_dir: Path
+    target_dir: Path
+    do_reduce: bool, optional
+    do_calibrate: bool, optional
+    do_average: bool, optional
+    do_merge: bool, optional
+    overwrite: bool, optional
+        If toggled, already existing flux calibrated files are redone
+    in_work_dir: bool, optional
+        If toggled, runs in a temporary directory that is removed afterwards. The
+        calibration leaves its 'esorex' output in the current working directory, so
+        epochs run in parallel each need their own
+    """
+    if in_work_dir:
+        previous_dir = Path.cwd()
+        with TemporaryDirectory(prefix="matadrs_") as work_dir:
+            os.chdir(work_dir)
+            try:
+                process_epoch(data_dir, stem_dir, target_dir, do_reduce,
+                              do_calibrate, do_average, do_merge, overwrite)
+            finally:
+                os.chdir(previous_dir)
+        return
+
+    start_time = time.time()
+    array = "ATs" if "ATs" in target_dir else "UTs"
+    cprint(f"Starting data improvement of {target_dir}!", "r")
+    cprint("----------------------------------------------------------------------",
+          "lg")
+    if do_reduce:
+        reduce(data_dir, stem_dir, target_dir, array)
+    if do_calibrate:
+        calibrate(data_dir, stem_dir, target_dir, overwrite=overwrite)
+    if do_average:
+        average(data_dir, stem_dir, target_dir)
+    if do_merge:
+        merge(data_dir, stem_dir, target_dir)
+    cprint("----------------------------------------------------------------------",
+          "lg")
+    cprint(f"Reduction, calibration, merging and averaging complete in "\
+           f"{datetime.timedelta(seconds=(time.time()-start_time))} hh:mm:ss",
+          "r")
+
+
 # TODO: Add functionality that clears all the paths before it write again,
 # as to overwrite them
 def matadrs_pipeline(data_dir: Path, stem_dir: Path,
@@ -19,7 +77,8 @@ def matadrs_pipeline(data_dir: Path, stem_dir: Path,
                      do_reduce: Optional[bool] = True,
                      do_calibrate: Optional[bool] = True,
                      do_average: Optional[bool] = True,
-                     do_merge: Optional[bool] = True):
+                     do_merge: Optional[bool] = True,
+                     overwrite: Optional[bool] = True):
     """Combines all the facettes of data reduction into one executable function that takes
     a list of epochs and different datasets to be reduced via the MATISSE pipeline, then
     calibrated, merged and averaged
@@ -33,26 +92,34 @@ def matadrs_pipeline(data_dir: Path, stem_dir: Path,
     do_calibrate: bool, optional
     do_average: bool, optional
     do_merge: bool, optional
+    overwrite: bool, optional
+        If toggled, already existing flux calibrated files are redone. Default is
+        toggled
     """
-    for target_dir in target_dirs:
-        start_time = time.time()
-        array = "ATs" if "ATs" in target_dir else "UTs"
-        cprint(f"Starting data improvement of {target_dir}!", "r")
-        cprint("----------------------------------------------------------------------",
-              "lg")
-        if do_reduce:
-            reduce(data_dir, stem_dir, target_dir, array)
-        if do_calibrate:
-            calibrate(data_dir, stem_dir, target_dir,)
-        if do_average:
-            average(data_dir, stem_dir, target_dir)
-        if do_merge:
-            merge(data_dir, stem_dir, target_dir)
-        cprint("----------------------------------------------------------------------",
-              "lg")
-        cprint(f"Reduction, calibration, merging and averaging complete in "\
-               f"{datetime.timedelta(seconds=(time.time()-start_time))} hh:mm:ss",
-              "r")
+    # NOTE: Resolved here, as parallel epochs change their working directory. The
+    # 'stem_dir' is joined onto it and thus absolute as well
+    data_dir = Path(data_dir).resolve()
+
+    if do_reduce:
+        missing = [raw_dir for target_dir in target_dirs
+                   if not (raw_dir := Path(data_dir, stem_dir, "raw", target_dir)).exists()]
+        if missing:
+            raise IOError(f"Missing raw directories: {missing}")
+
+    # NOTE: The epochs share no state and can be processed in parallel. Each of them
+    # already uses multiple cores for the reduction, so the default stays serial
+    epoch_workers = int(os.environ.get("MATADRS_EPOCH_WORKERS", "1"))
+    steps = (do_reduce, do_calibrate, do_average, do_merge, overwrite)
+    if epoch_workers > 1 and len(target_dirs) > 1:
+        with ProcessPoolExecutor(max_workers=epoch_workers) as executor:
+            futures = [executor.submit(process_epoch, data_dir, stem_dir, target_dir,
+                                       *steps, in_work_dir=True)
+                       for target_dir in target_dirs]
+            for future in as_completed(futures):
+                future.result()
+    else:
+        for target_dir in target_dirs:
+            process_epoch(data_dir, stem_dir, target_dir, *steps)
     print("----------------------------------------------------------------------")
     print("All done!")
 
@@ -1,7 +1,8 @@
 import os
 from pathlib import Path
 from warnings import warn
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 import pandas as pd
@@ -49,8 +50,14 @@ class Plotter:
 
         self.save_path = save_path
         self.components = {}
+        self._wl = None
 
-        self.wl = self.data_prep.oi_wl["EFF_WAVE"].data[0]
+    @property
+    def wl(self):
+        """The wavelength solution. Only read when the first component is made"""
+        if self._wl is None:
+            self._wl = self.data_prep.oi_wl["EFF_WAVE"].data[0]
+        return self._wl
 
     @property
     def number_of_plots(self):
@@ -63,17 +70,20 @@ class Plotter:
     def band_mask(self):
         """The masking for the bands to make the plots visually readable"""
         if self._band_mask is None:
-            wl = pd.DataFrame({"wl": self.wl})
+            # NOTE: Boolean masks are computed directly on the wavelength array and the
+            # negated mask is cached, as it is the one applied for every component
+            wl = np.asarray(self.wl)
             if np.any(wl < 7.):
                 if np.any(wl < 2.) and np.any(wl > 3.):
-                    self._band_mask = (wl > 1.6) & (wl < 1.8) & (wl > 3.) & (wl < 4.)
+                    band_mask = ((wl > 1.6) & (wl < 1.8)) | ((wl > 3.) & (wl < 4.))
                 elif np.any(wl < 2.):
-                    self._band_mask = (wl > 1.6) & (wl < 1.8)
+                    band_mask = (wl > 1.6) & (wl < 1.8)
                 else:
-                    self._band_mask = (wl > 3.) & (wl < 4.)
+                    band_mask = (wl > 3.) & (wl < 4.)
             else:
-                self._band_mask = (wl > 8.5) & (wl < 12.5)
-        return ~self._band_mask["wl"]
+                band_mask = (wl > 8.5) & (wl < 12.5)
+            self._band_mask = ~band_mask
+        return self._band_mask
 
     # TODO: This should not need to be a thing, but it doesn't work otherwise
     def mask_dataframe(self, df: DataFrame, mask: np.ndarray) -> None:
@@ -106,23 +116,25 @@ class Plotter:
             df = self.set_dataframe(self.data_prep.oi_flux["TEL_NAME"],
                                     self.data_prep.oi_flux["FLUXDATA"])
         elif (data_name == "vis") or (data_name == "vis2"):
-            # TODO: Check if there are edge cases where oi_vis needs to be used
-            station_names = self.data_prep.oi_vis["DELAY_LINE"]
+            # NOTE: The labels are taken from the plotted table, so only it is read
+            table = self.data_prep.oi_vis if data_name == "vis" else self.data_prep.oi_vis2
+            station_names = table["DELAY_LINE"]
             if legend_format == "long":
-                baselines = np.around(self.data_prep.oi_vis["BASELINE"], 2)
-                u_coords = self.data_prep.oi_vis["UVCOORD"][:, 0]
-                v_coords = self.data_prep.oi_vis["UVCOORD"][:, 1]
-                pas = np.around((np.degrees(np.arctan2(v_coords, u_coords))-90)*-1, 2)
+                # NOTE: The arithmetic is done on the whole arrays, the rounding is left
+                # to the format spec of the per baseline labels
+                uv_coords = np.asarray(table["UVCOORD"])
+                baselines = np.asarray(table["BASELINE"])
+                pas = (np.degrees(np.arctan2(uv_coords[:, 1], uv_coords[:, 0]))-90)*-1
                 # TODO: Make the variables into mathrm
-                labels = [fr"{station_name} $B_p$={baseline} m $\phi={pa}^\circ$"\
-                        for station_name, baseline, pa in zip(station_names, baselines, pas)]
+                labels = [fr"{station_name} $B_p$={baseline:.2f} m $\phi={pa:.2f}^\circ$"\
+                        for station_name, baseline, pa in zip(station_names,
+                                                               baselines.tolist(),
+                                                               pas.tolist())]
             else:
                 labels = station_names
 
-            if data_name == "vis":
-                df = self.set_dataframe(labels, self.data_prep.oi_vis["VISAMP"])
-            else:
-                df = self.set_dataframe(labels, self.data_prep.oi_vis2["VIS2DATA"])
+            df = self.set_dataframe(labels,
+                                    table["VISAMP" if data_name == "vis" else "VIS2DATA"])
             # TODO: Find out what this is exactly? Projected Baselines? Positional Angle?
         elif data_name == "cphase":
             df =  self.set_dataframe(self.data_prep.oi_t3["TRIANGLE"],
@@ -156,21 +168,19 @@ class Plotter:
             # TODO: Implement flux np.nan detection and not plotting it
             for ax, (name, dataframe) in zip(axarr.flatten(), self.components.items()):
                 dataframe.plot(x="lambda", xlabel=r"$\lambda$ [$\mathrm{\mu}$m]",
-                               ylabel=name, ax=ax, legend=True)
-                plt.legend(fontsize=6)
+                               ylabel=name, ax=ax, legend=False, rasterized=True)
+                ax.legend(fontsize=6)
         else:
             # TODO: Make this more modular for future plots
-            name, dataframe = self.components[0].items()
+            name, dataframe = next(iter(self.components.items()))
             dataframe.plot(x="lambda", xlabel=r"$\lambda$ [$\mathrm{\mu}$m]",
-                           ylabel=name, ax=axarr, legend=True)
-
-        fig.tight_layout()
+                           ylabel=name, ax=axarr, legend=True, rasterized=True)
 
         if save:
-            plt.savefig(str(self.save_path / self.plot_name), format="pdf")
+            fig.savefig(str(self.save_path / self.plot_name), format="pdf")
         else:
             plt.show()
-        plt.close()
+        plt.close(fig)
         # ax.legend(loc=1, prop={'size': 6}, ncol=ncol)
 
     # TODO: Make somehow correlated flux and unit support in this component
@@ -280,6 +290,65 @@ class Plotter:
             # ax.arrow(x, y, dx, dy, **arrow_args)
 
 
+def _init_plot_worker() -> None:
+    """Switches the plotting worker processes to the non-interactive backend"""
+    plt.switch_backend("Agg")
+
+
+def plot_fits_file(fits_file: Path, save_path: Path) -> None:
+    """Plots the closure phases and visibilities of a (.fits)-file and saves the plot
+
+    Parameters
+    ----------
+    fits_file: Path
+    save_path: Path
+    """
+    plot_fits = Plotter([fits_file], save_path=save_path)
+    plot_fits.add_cphase().add_vis().plot(save=True)
+
+
+def is_plot_up_to_date(fits_file: Path, save_path: Path) -> bool:
+    """Checks if the plot of a (.fits)-file exists and is newer than the file itself
+
+    Parameters
+    ----------
+    fits_file: Path
+    save_path: Path
+
+    Returns
+    -------
+    bool
+    """
+    plot_file = save_path / f"{fits_file.stem}.pdf"
+    return plot_file.exists()\
+            and plot_file.stat().st_mtime >= fits_file.stat().st_mtime
+
+
+def plot_fits_files(plot_tasks: List[Tuple[Path, Path]],
+                    overwrite: Optional[bool] = False) -> None:
+    """Plots multiple (.fits)-files in parallel
+
+    Parameters
+    ----------
+    plot_tasks: List[Tuple[Path, Path]]
+        The (.fits)-files and the paths their plots are saved to
+    overwrite: bool, optional
+        If toggled, replots files whose plots are already up to date
+    """
+    if not overwrite:
+        plot_tasks = [(fits_file, save_path) for fits_file, save_path in plot_tasks
+                      if not is_plot_up_to_date(fits_file, save_path)]
+    if not plot_tasks:
+        return
+
+    with ProcessPoolExecutor(max_workers=min(len(plot_tasks), os.cpu_count() or 1),
+                             initializer=_init_plot_worker) as executor:
+        futures = [executor.submit(plot_fits_file, fits_file, save_path)
+                   for fits_file, save_path in plot_tasks]
+        for future in as_completed(futures):
+            future.result()
+
+
 # def rotation_synthesis_uv(inp):
     # """This function was written by Jozsef Varga (from menEWS: menEWS_plot.py).
 
@@ -1,4 +1,5 @@
 import warnings
+from functools import cached_property, lru_cache
 from pathlib import Path
 from typing import Optional, Dict, List
 
@@ -29,6 +30,34 @@ STATION_INDICES_TO_NAMES.update(MED)
 STATION_INDICES_TO_NAMES.update(LARGE)
 STATION_INDICES_TO_NAMES.update(UT)
 
+# NOTE: Lookup array of the station names by their indices for vectorised access
+STATION_NAMES = np.array([STATION_INDICES_TO_NAMES.get(index, "")
+                          for index in range(max(STATION_INDICES_TO_NAMES)+1)])
+
+
+# NOTE: Files of the same target share (nearly) the same coordinates, the rounding
+# to ~0.4 arcsec makes them hit the same cache entry
+@lru_cache(maxsize=None)
+def query_simbad_name(ra: float, dec: float) -> str:
+    """Fetches a target's name via Simbad by its coordinates. Each target is only
+    queried once per process
+
+    Parameters
+    ----------
+    ra: float
+        The right ascension in degrees
+    dec: float
+        The declination in degrees
+
+    Returns
+    -------
+    name: str
+    """
+    coords = SkyCoord(ra*u.deg, dec*u.deg, frame="icrs")
+    objects = Simbad.query_region(coords, radius=20*u.arcsec)["MAIN_ID"].data.tolist()
+    # TODO: Maybe improve the way the common string is found? -> Multiple string names
+    return sorted(objects)[0]
+
 
 # TODO: Improve docs
 # TODO: Add to fluxcalibration that it changes the unit to Jy not ADU -> Jozsef's script
@@ -39,132 +68,140 @@ class ReadoutFits:
         self.fits_file = Path(fits_file)
         self.flux_file = Path(flux_file) if flux_file else None
 
-        self._name = None
-
-        self._oi_wl = None
-        self._oi_flux, self._oi_t3 = None, None
-        self._oi_vis, self._oi_vis2 = None, None
-        self._telescope_to_station_names = None
+        self._hdul = None
 
-        with fits.open(self.fits_file) as hdul:
+        # NOTE: Only the primary header is read here, the data is never loaded
+        with fits.open(self.fits_file, mode="readonly",
+                       memmap=True, lazy_load_hdus=True) as hdul:
             self.primary_header = hdul[0].header
 
         self.target_name = self.primary_header["OBJECT"]
         self.ra, self.dec = self.primary_header["RA"], self.primary_header["DEC"]
         self.coords = SkyCoord(self.ra*u.deg, self.dec*u.deg, frame="icrs")
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        self.close()
+
     @property
+    def hdul(self) -> fits.HDUList:
+        """The (.fits)-file's HDUList. Opened once on first access and then kept open
+        for all further table reads, until 'close' is called"""
+        if self._hdul is None:
+            self._hdul = fits.open(self.fits_file, mode="readonly",
+                                   memmap=True, lazy_load_hdus=True)
+        return self._hdul
+
+    def close(self) -> None:
+        """Closes the (.fits)-file if it has been opened for reading tables"""
+        if getattr(self, "_hdul", None) is not None:
+            self._hdul.close()
+            self._hdul = None
+
+    @cached_property
     def name(self):
         """Fetches the target's name via Simbad by its coordinates"""
         # TODO: Make this DISCLAIMER better -> Internet requirement
-        if self._name is None:
-            header_name = self.primary_header["OBJECT"]
-            if header_name in ["SKY", "STD", "STD,RMNREC"]:
-                objects = Simbad.query_region(self.coords,
-                                              radius=20*u.arcsec)["MAIN_ID"].data.tolist()
-                # TODO: Maybe improve the way the common string is found? -> Multiple string names
-                self._name = sorted(objects)[0]
-            else:
-                self._name = header_name.lower()
-        return self._name
+        header_name = self.primary_header["OBJECT"]
+        if header_name in ["SKY", "STD", "STD,RMNREC"]:
+            return query_simbad_name(round(self.ra, 4), round(self.dec, 4))
+        return header_name.lower()
 
-    @property
+    @cached_property
     def longest_entry(self):
-        """The longest entry of all the rows. Fetched from the 'oi_wl'-tables"""
-        return np.max(self.oi_wl["EFF_WAVE"].shape)
+        """The longest entry of all the rows. Fetched from the 'oi_wavelength'-header's
+        row count, so the table itself is not read"""
+        return self.hdul["oi_wavelength"].header["NAXIS2"]
 
-    @property
+    @cached_property
     def oi_wl(self):
         """Gets the wavelength table and reforms it into one entry"""
-        if self._oi_wl is None:
-            self._oi_wl = Table()
-            wl = self.get_table_for_fits("oi_wavelength")["EFF_WAVE"]
-            self._oi_wl.add_column(self._oi_wl.Column([wl.data.astype(np.float64)],
-                                                      unit=wl.unit), name="EFF_WAVE")
-            self._oi_wl["EFF_WAVE"] = self._oi_wl["EFF_WAVE"].to(u.um)
-        return self._oi_wl
-
-    @property
+        oi_wl = Table()
+        wl = self.get_table_for_fits("oi_wavelength")["EFF_WAVE"]
+        # NOTE: Converted to micrometers in a single pass
+        scale = (wl.unit or u.m).to(u.um)
+        oi_wl.add_column(oi_wl.Column([np.asarray(wl, dtype=np.float64)*scale],
+                                      unit=u.um), name="EFF_WAVE")
+        return oi_wl
+
+    @cached_property
     def oi_flux(self):
         """Fetches the flux table if given, and if not makes an empty one"""
-        if self._oi_flux is None:
-            # NOTE: Not all MATISSE datasets contain 'oi_flux'-data, thus try-except
-            try:
-                self._oi_flux = self.get_table_for_fits("oi_flux")
-            except KeyError:
-                self._oi_flux = Table()
-                if self.flux_file is not None:
-                    flux, flux_err = self.get_flux_data_from_flux_file()
-                    self._oi_flux.add_columns([self._oi_flux.Column([flux], unit=u.Jy),
-                                              self._oi_flux.Column([flux_err], unit=u.Jy)],
-                                              names=["FLUXDATA", "FLUXERR"])
-                else:
-                    # TODO: Make this work so the unit is Jy -> Right now it has no effect
-                    nan_array = self._oi_flux.Column(np.full(self.longest_entry, np.nan),
-                                                     unit=u.Jy)
-                    self._oi_flux.add_columns([[nan_array], [nan_array]],
-                                              names=["FLUXDATA", "FLUXERR"])
-            self._oi_flux.add_column([self.get_table_for_fits("oi_array")["TEL_NAME"].astype(str)],
-                                     name="TEL_NAME")
-            self._oi_flux.keep_columns(["FLUXDATA", "FLUXERR", "TEL_NAME"])
+        # NOTE: Not all MATISSE datasets contain 'oi_flux'-data, thus try-except
+        try:
+            oi_flux = self.get_table_for_fits("oi_flux")
+        except KeyError:
+            oi_flux = Table()
+            if self.flux_file is not None:
+                flux, flux_err = self.get_flux_data_from_flux_file()
+                oi_flux.add_columns([oi_flux.Column([flux], unit=u.Jy),
+                                     oi_flux.Column([flux_err], unit=u.Jy)],
+                                    names=["FLUXDATA", "FLUXERR"])
+            else:
+                # TODO: Make this work so the unit is Jy -> Right now it has no effect
+                nan_array = oi_flux.Column(np.full(self.longest_entry, np.nan),
+                                           unit=u.Jy)
+                oi_flux.add_columns([[nan_array], [nan_array]],
+                                    names=["FLUXDATA", "FLUXERR"])
+        oi_flux.add_column([self.get_table_for_fits("oi_array")["TEL_NAME"].astype(str)],
+                           name="TEL_NAME")
+        oi_flux.keep_columns(["FLUXDATA", "FLUXERR", "TEL_NAME"])
         # TODO: Maybe remove "TEL_NAME"
-        return self._oi_flux
+        return oi_flux
 
-    @property
+    @cached_property
     def oi_vis(self):
         """Fetches the visibility table"""
-        if self._oi_vis is None:
-            self._oi_vis = self.get_table_for_fits("oi_vis")
-            self._oi_vis.add_columns([self.get_delay_lines(self._oi_vis),
-                                      self.merge_uv_coords(self._oi_vis),
-                                      self.get_baselines(self._oi_vis)],
-                                     names=["DELAY_LINE", "UVCOORD", "BASELINE"])
-            self._oi_vis.keep_columns(["VISAMP", "VISAMPERR",
-                                        "UVCOORD", "DELAY_LINE", "BASELINE"])
-        return self._oi_vis
-
-    @property
+        oi_vis = self.get_table_for_fits("oi_vis")
+        oi_vis.add_columns([self.get_delay_lines(oi_vis),
+                            self.merge_uv_coords(oi_vis),
+                            self.get_baselines(oi_vis)],
+                           names=["DELAY_LINE", "UVCOORD", "BASELINE"])
+        oi_vis.keep_columns(["VISAMP", "VISAMPERR",
+                             "UVCOORD", "DELAY_LINE", "BASELINE"])
+        return oi_vis
+
+    @cached_property
     def oi_vis2(self):
         """Fetches the squared visibility table"""
-        if self._oi_vis2 is None:
-            self._oi_vis2 = self.get_table_for_fits("oi_vis2")
-            self._oi_vis2.add_columns([self.get_delay_lines(self._oi_vis2),
-                                       self.merge_uv_coords(self._oi_vis2),
-                                       self.get_baselines(self._oi_vis2)],
-                                      names=["DELAY_LINE", "UVCOORD", "BASELINE"])
-            self._oi_vis2.keep_columns(["VIS2DATA", "VIS2ERR",
-                                        "UVCOORD", "DELAY_LINE", "BASELINE"])
-        return self._oi_vis2
-
-    @property
+        oi_vis2 = self.get_table_for_fits("oi_vis2")
+        oi_vis2.add_columns([self.get_delay_lines(oi_vis2),
+                             self.merge_uv_coords(oi_vis2),
+                             self.get_baselines(oi_vis2)],
+                            names=["DELAY_LINE", "UVCOORD", "BASELINE"])
+        oi_vis2.keep_columns(["VIS2DATA", "VIS2ERR",
+                              "UVCOORD", "DELAY_LINE", "BASELINE"])
+        return oi_vis2
+
+    @cached_property
     def oi_t3(self):
         """Fetches the closure phase table"""
-        if self._oi_t3 is None:
-            self._oi_t3 = self.get_table_for_fits("oi_t3")
-            u1, u2 = self._oi_t3["U1COORD"], self._oi_t3["U2COORD"]
-            v1, v2 = self._oi_t3["V1COORD"], self._oi_t3["V2COORD"]
-            uv_coords = []
-            # NOTE: After Jozsef: u3, v3 = -(u1+u2), -(v1+v2) -> Dropping the minus
-            # better closure phases in modelling -> Check that!
-            for u_coord, v_coord in zip(zip(u1, u2, u1+u2), zip(v1, v2, v1+v2)):
-                uv_coords.append(np.array(list(zip(u_coord, v_coord))))
-            uv_coords = np.array(uv_coords)
-            baselines = [np.sqrt(uv_coord[:, 0]**2+uv_coord[:, 1]**2)\
-                    for uv_coord in uv_coords]
-            self._oi_t3.add_columns([uv_coords,
-                                     self.get_delay_lines(self._oi_t3), baselines],
-                                    names=["UVCOORD", "TRIANGLE", "BASELINE"])
-            self._oi_t3.keep_columns(["T3PHI", "T3PHIERR",
-                                      "UVCOORD", "TRIANGLE", "BASELINE"])
-        return self._oi_t3
-
-    @property
+        oi_t3 = self.get_table_for_fits("oi_t3")
+        u1, u2, v1, v2 = [np.asarray(oi_t3[column], dtype=np.float64)
+                          for column in ["U1COORD", "U2COORD", "V1COORD", "V2COORD"]]
+        # NOTE: After Jozsef: u3, v3 = -(u1+u2), -(v1+v2) -> Dropping the minus
+        # better closure phases in modelling -> Check that!
+        uv_coords = np.stack([np.column_stack((u1, v1)), np.column_stack((u2, v2)),
+                              np.column_stack((u1+u2, v1+v2))], axis=1)
+        baselines = np.hypot(uv_coords[..., 0], uv_coords[..., 1])
+        oi_t3.add_columns([uv_coords, self.get_delay_lines(oi_t3), baselines],
+                          names=["UVCOORD", "TRIANGLE", "BASELINE"])
+        oi_t3.keep_columns(["T3PHI", "T3PHIERR",
+                            "UVCOORD", "TRIANGLE", "BASELINE"])
+        return oi_t3
+
+    @cached_property
     def bcd_configuration(self):
         """Gets the BCD-configuration from the primary header"""
         return "-".join([self.primary_header["HIERARCH ESO INS BCD1 ID"],
                          self.primary_header["HIERARCH ESO INS BCD2 ID"]]).lower()
 
-    @property
+    @cached_property
     def tpl_start(self):
         """Gets the template start datetime from the primary header"""
         return self.primary_header["HIERARCH ESO TPL START"]
@@ -202,22 +239,30 @@ class ReadoutFits:
         -------
         Table
         """
-        return Table().read(self.fits_file, hdu=header)
+        return Table.read(self.hdul[header])
 
     def merge_uv_coords(self, table: Table):
         """Merges the u- and v-coordinates into a set of (u, v)-coordinates"""
-        u_coords, v_coords = table["UCOORD"], table["VCOORD"]
-        return np.array(list(zip(u_coords, v_coords)))
+        return np.column_stack((np.asarray(table["UCOORD"], dtype=np.float64),
+                                np.asarray(table["VCOORD"], dtype=np.float64)))
 
     def get_baselines(self, table: Table):
         """Calculates the baselines from the (u, v)-coordinates"""
-        u_coords, v_coords = table["UCOORD"], table["VCOORD"]
-        return np.sqrt(u_coords**2+v_coords**2)
+        return np.hypot(np.asarray(table["UCOORD"], dtype=np.float64),
+                        np.asarray(table["VCOORD"], dtype=np.float64))
 
     def get_delay_lines(self, table: Table):
         """Fetches the delay lines' telescope configuration from the visibility table"""
-        return ["-".join(list(map(STATION_INDICES_TO_NAMES.get, station_index)))
-                for station_index in table["STA_INDEX"]]
+        station_indices = np.asarray(table["STA_INDEX"])
+        unknown = ~np.isin(station_indices, list(STATION_INDICES_TO_NAMES))
+        if unknown.any():
+            raise ValueError("Unknown station index/indices in 'STA_INDEX':"
+                             f" {np.unique(station_indices[unknown]).tolist()}")
+        station_names = STATION_NAMES[station_indices]
+        delay_lines = station_names[:, 0]
+        for names in station_names[:, 1:].T:
+            delay_lines = np.char.add(np.char.add(delay_lines, "-"), names)
+        return delay_lines.tolist()
 
 
 if __name__ == "__main__":
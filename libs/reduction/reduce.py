@@ -2,22 +2,31 @@ import os
 import time
 import datetime
 import shutil
+import threading
+from enum import IntEnum
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-import numpy as np
 import astropy.units as u
-from astropy.table import Table
+from astropy.io import fits
 from astroquery.vizier import Vizier
 from astropy.coordinates import SkyCoord
 from mat_tools import mat_autoPipeline as mp
 
 # TODO: Find way to make this into a complete module -> More pythonic!
-from plot import Plotter
+from plot import plot_fits_files
 from utils import cprint, get_fits_by_tag
 from readout import ReadoutFits
 
 
+class Mode(IntEnum):
+    """The modes the reduction can be done in"""
+    INCOHERENT = 0
+    COHERENT = 1
+
+
 DATA_DIR = Path(__file__).parent.parent.parent / "data"
 CATALOG_DIR = DATA_DIR / "catalogues"
 
@@ -27,29 +36,63 @@ ADDITIONAL_CATALOG = CATALOG_DIR / "supplementary_catalog_202207.fits"
 
 SPECTRAL_BINNING = {"low": [5, 7], "high_ut": [5, 38], "high_at": [5, 98]}
 
+MODES, BANDS = [Mode.COHERENT, Mode.INCOHERENT], ["lband", "nband"]
+
+# NOTE: Calibrators are usually observed at multiple tpl starts, this keeps the
+# (possibly remote) catalog lookup to one per target
+_catalog_match_cache: Dict[str, Optional[Path]] = {}
+
+# NOTE: The number of cores a single 'mat_autoPipeline' call is run with
+NUMBER_CORES = 6
+
+# NOTE: The number of threads the (.fits)-file headers are read with
+SCAN_WORKERS = 8
 
-# TODO: Maybe there is a smarter way than globbing twice? Not that important however...
-def get_tpl_match(raw_dir: Path, tpl_start: str):
-    """Gets a (.fits)-file matching the tpl start
+
+def get_readouts_by_tpl(raw_dir: Path) -> Dict[str, ReadoutFits]:
+    """Reads the primary header of every (.fits)-file in the directory once and maps
+    each tpl start to the first readout found for it
 
     Parameters
     ----------
     raw_dir: Path
-    tpl_start: str
 
     Returns
     -------
-    fits_file: Path
+    readouts: Dict[str, ReadoutFits]
     """
-    for fits_file in raw_dir.glob("*.fits"):
-        if tpl_start == ReadoutFits(fits_file).tpl_start:
-            return fits_file
-    raise FileNotFoundError("No file with matching tpl_start exists!")
+    def read_tpl_start(fits_file: Path) -> Tuple[str, ReadoutFits]:
+        readout = ReadoutFits(fits_file)
+        return readout.tpl_start, readout
+
+    # NOTE: The header reads are I/O-bound and overlap in threads, 'map' keeps the
+    # sorted order so the first readout of each tpl start is still kept
+    readouts = {}
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        for tpl_start, readout in executor.map(read_tpl_start,
+                                               sorted(raw_dir.glob("*.fits"))):
+            readouts.setdefault(tpl_start, readout)
+    return readouts
+
 
+@lru_cache(maxsize=4)
+def _load_catalog(catalog: Path) -> SkyCoord:
+    """Reads the coordinates of a (.fits)-catalog once per process. Caching the
+    coordinates also keeps the KD-tree that 'match_to_catalog_sky' builds on them
+
+    Parameters
+    ----------
+    catalog: Path
 
-def get_tpl_starts(raw_dir: Path):
-    """Iterates through all files and gets their tpl start times"""
-    return set([ReadoutFits(fits_file).tpl_start for fits_file in raw_dir.glob("*.fits")])
+    Returns
+    -------
+    coords_catalog: SkyCoord
+    """
+    # NOTE: Only the two coordinate columns are read from the memory-mapped table
+    with fits.open(catalog, memmap=True) as hdul:
+        ra, dec = [column.astype(str) if column.dtype.kind == "S" else column.copy()
+                   for column in (hdul[1].data["RAJ2000"], hdul[1].data["DEJ2000"])]
+    return SkyCoord(ra, dec, unit=(u.hourangle, u.deg), frame="icrs")
 
 
 def in_catalog(readout: ReadoutFits, radius: u.arcsec, catalog: Path):
@@ -65,11 +108,9 @@ def in_catalog(readout: ReadoutFits, radius: u.arcsec, catalog: Path):
     -------
     catalog: Path | None
     """
-    table = Table().read(catalog)
-    coords_catalog = SkyCoord(table["RAJ2000"], table["DEJ2000"],
-                              unit=(u.hourangle, u.deg), frame="icrs")
-    separation = readout.coords.separation(coords_catalog)
-    if separation[np.nanargmin(separation)] < radius.to(u.deg):
+    coords_catalog = _load_catalog(catalog)
+    _, separation, _ = readout.coords.match_to_catalog_sky(coords_catalog)
+    if separation < radius.to(u.deg):
         cprint(f"Calibrator '{readout.name}' found in supplementary catalog!", "g")
         return catalog
     cprint(f"Calibrator '{readout.name}' not found in any catalogs!"
@@ -79,7 +120,8 @@ def in_catalog(readout: ReadoutFits, radius: u.arcsec, catalog: Path):
 
 def get_catalog_match(readout: ReadoutFits, match_radius: u.arcsec = 20*u.arcsec):
     """Checks if the calibrator is in the 'jsdc_v2'-catalog and if not then searches the
-    local calibrator databases
+    local calibrator databases. The local copy of the 'jsdc_v2'-catalog is used if
+    available, otherwise Vizier is queried
 
     Parameters
     ----------
@@ -91,115 +133,199 @@ def get_catalog_match(readout: ReadoutFits, match_radius: u.arcsec = 20*u.arcsec
     -------
     catalog: Path | None
     """
-    match = JSDC_V2_CATALOG.query_region(readout.coords, radius=match_radius)
-    if match:
-        if len(match[0]) > 0:
-            cprint(f"Calibrator '{match[0]['Name'][0]}' found in JSDC v2 catalog!",
-                   "y")
-        return JSDC_CATALOG
-    return in_catalog(readout.coords, radius=match_radius, catalog=ADDITIONAL_CATALOG)
-
-
-def set_script_arguments(corr_flux: bool, array: str,
-                         resolution: Optional[str] = "low") -> str:
-    """Sets the arguments that are then passed to the 'mat_autoPipeline.py'
+    if JSDC_CATALOG.exists():
+        coords_catalog = _load_catalog(JSDC_CATALOG)
+        _, separation, _ = readout.coords.match_to_catalog_sky(coords_catalog)
+        if separation < match_radius.to(u.deg):
+            cprint(f"Calibrator '{readout.name}' found in JSDC v2 catalog!", "y")
+            return JSDC_CATALOG
+    else:
+        match = JSDC_V2_CATALOG.query_region(readout.coords, radius=match_radius)
+        if match:
+            if len(match[0]) > 0:
+                cprint(f"Calibrator '{match[0]['Name'][0]}' found in JSDC v2 catalog!",
+                       "y")
+            return JSDC_CATALOG
+    return in_catalog(readout, radius=match_radius, catalog=ADDITIONAL_CATALOG)
+
+
+def _make_script_arguments(mode: Mode, array: str, resolution: str) -> Tuple[str, str]:
+    """Builds the arguments that are then passed to the 'mat_autoPipeline.py'
     script
 
     Parameters
     ----------
-    corr_flux: bool
-        This specifies if the flux is to be reduced or not
+    mode: Mode
+        The mode in which the reduction is to be done
     array: str
         The array configuration that was used for the observation
     resolution: str
-        This determines the spectral binning. Input can be "low" for
-        low-resolution in both bands, "high_ut" for low-resolution in L-band
-        and high-resolution in N-band for the UTs and the same for "high_at" for
-        the ATs
+        The key of the spectral binning in 'SPECTRAL_BINNING'
 
     Returns
     -------
-    str
-        A string that contains the arguments, which are passed to the
-        MATISSE-pipline
+    paramL: str
+    paramN: str
     """
-    if resolution == "high":
-        resolution = f"{resolution}_{array.lower()[:-1]}"
     bin_L, bin_N = SPECTRAL_BINNING[resolution]
     # NOTE: Jozsef uses TEL 3 here, but Jacob 2? What is the meaning of this
     # -> Read up on it. Already asked! Awaiting response
     compensate = '/compensate="[pb,rb,nl,if,bp,od]"'
     tel = "/replaceTel=3" if array == "ATs" else "/replaceTel=0"
     coh_L  = f"/corrFlux=TRUE/useOpdMod=FALSE/coherentAlgo=2"\
-            if corr_flux else ""
-    coh_N = f"/corrFlux=TRUE/useOpdMod=TRUE/coherentAlgo=2" if corr_flux else ""
+            if mode is Mode.COHERENT else ""
+    coh_N = f"/corrFlux=TRUE/useOpdMod=TRUE/coherentAlgo=2"\
+            if mode is Mode.COHERENT else ""
     paramL_lst = f"{coh_L}{compensate}/spectralBinning={bin_L}"
     paramN_lst = f"{tel}{coh_N}/spectralBinning={bin_N}"
     return paramL_lst, paramN_lst
 
 
+# NOTE: All argument combinations are precomputed, "high" resolves to the array's
+# high resolution binning
+SCRIPT_ARGUMENTS = {(mode, array, resolution): _make_script_arguments(
+    mode, array, f"high_{array.lower()[:-1]}" if resolution == "high" else resolution)
+                    for mode in Mode for array in ["ATs", "UTs"]
+                    for resolution in [*SPECTRAL_BINNING, "high"]}
+
+
+def set_script_arguments(mode: Mode, array: str,
+                         resolution: Optional[str] = "low") -> Tuple[str, str]:
+    """Gets the arguments that are then passed to the 'mat_autoPipeline.py'
+    script
+
+    Parameters
+    ----------
+    mode: Mode
+        The mode in which the reduction is to be done, either "Mode.INCOHERENT" or
+        "Mode.COHERENT" (reduces the correlated flux)
+    array: str
+        The array configuration that was used for the observation
+    resolution: str
+        This determines the spectral binning. Input can be "low" for
+        low-resolution in both bands, "high_ut" for low-resolution in L-band
+        and high-resolution in N-band for the UTs and the same for "high_at" for
+        the ATs
+
+    Returns
+    -------
+    paramL: str
+    paramN: str
+        The strings that contain the arguments, which are passed to the
+        MATISSE-pipline
+    """
+    return SCRIPT_ARGUMENTS[(mode, array, resolution)]
+
+
+def prepare_catalogs(readout: ReadoutFits) -> Optional[Path]:
+    """Checks if the target observed at the tpl start is a calibrator and if so gets
+    the catalog it is contained in
+
+    Parameters
+    ----------
+    readout: ReadoutFits
+        The readout of a (.fits)-file of the tpl start
+
+    Returns
+    -------
+    catalog: Path | None
+    """
+    if readout.is_calibrator():
+        if readout.name in _catalog_match_cache:
+            cprint(f"Calibrator '{readout.name}' detected! Using known catalog...", "g")
+        else:
+            cprint(f"Calibrator '{readout.name}' detected!"
+                   f" Checking for catalog...", "g")
+            _catalog_match_cache[readout.name] = get_catalog_match(readout)
+        return _catalog_match_cache[readout.name]
+    cprint(f"Science target '{readout.name}' detected! Omitting catalogs...", "y")
+    return None
+
+
+def prepare_calib_dir(calib_dir: Path, tpl_calib_dir: Path,
+                      catalog: Optional[Path] = None) -> None:
+    """Links the calibration files into a separate folder for a single tpl start and
+    adds the catalog, if given. This keeps the catalogs of the different tpl starts
+    apart, so they can be reduced simultaneously
+
+    Parameters
+    ----------
+    calib_dir: Path
+        The path containing the calibration files
+    tpl_calib_dir: Path
+        The path to contain the calibration files of a single tpl start
+    catalog: Path, optional
+        The catalog the calibrator is contained in
+    """
+    tpl_calib_dir.mkdir(parents=True)
+    for calibration_file in calib_dir.glob("*"):
+        if "catalog" not in calibration_file.name:
+            (tpl_calib_dir / calibration_file.name).symlink_to(calibration_file)
+    if catalog is not None:
+        cprint(f"Linking catalog to {tpl_calib_dir.parent.name}...", "g")
+        (tpl_calib_dir / catalog.name).symlink_to(catalog.resolve())
+
+
 def reduce_mode_and_band(raw_dir: Path, calib_dir: Path, res_dir: Path,
-                         array: str, mode: bool, band: str, tpl_start: str,
-                         resolution: Optional[str] = "low") -> None:
+                         work_dir: Path, array: str, mode: Mode, band: str,
+                         tpl_start: str, resolution: Optional[str] = "low") -> None:
     """Reduces either the lband or the nband data for either the "coherent" or
     "incoherent" setting for a single iteration/epoch.
 
-    Removes the old (.sof)-files to ensure proper reduction and then creates the needed
-    folders in the "res_dir"-directory. After this, it starts the reduction with the
-    specified settings
+    Creates the needed folders in the "res_dir"-directory and then starts the reduction
+    with the specified settings in the "work_dir"-directory. After this, it moves the
+    reduced folders to the "res_dir"-directory
 
     Parameters
     ----------
     raw_dir: Path
         The path containing the raw observation files
     calib_dir: Path
-        The path containing the calibration files
+        The path containing the calibration files (and catalog) of the tpl start
     res_dir: Path
         The path to contain to reduced data
+    work_dir: Path
+        The path the 'mat_autoPipeline' writes its results to for the tpl start, mode
+        and band
     array: str
         The array configuration that was used for the observation. Either "AT" or "UT"
-    mode: bool
-        The mode in which the reduction is to be done, either "incoherent" if "False" or
-        "coherent" if "True"
+    mode: Mode
+        The mode in which the reduction is to be done, either "Mode.INCOHERENT" or
+        "Mode.COHERENT"
     band: str
         The band for which the reduction is to be done, either "lband" or "nband"
     tpl_star: str
         The starting time of target's observations
     """
     start_time = time.perf_counter()
-    mode_and_band_dir = res_dir / mode / band
+    mode_name = mode.name.lower()
+    mode_and_band_dir = res_dir / mode_name / band
     param_L, param_N = set_script_arguments(mode, array, resolution)
     skip_L = True if band == "nband" else False
     skip_N = not skip_L
 
-    if not mode_and_band_dir.exists():
-        mode_and_band_dir.mkdir(parents=True)
+    mode_and_band_dir.mkdir(parents=True, exist_ok=True)
+    work_dir.mkdir(parents=True, exist_ok=True)
 
-    readout = ReadoutFits(get_tpl_match(raw_dir, tpl_start))
-    if readout.is_calibrator():
-        cprint(f"Calibrator '{readout.name}' detected!"
-               f" Checking for catalog...", "g")
-        catalog_path = get_catalog_match(readout)
-        if catalog_path is not None:
-            cprint(f"Moving catalog to {calib_dir.name}...", "g")
-            shutil.copy(catalog_path, calib_dir / catalog_path.name)
-    else:
-        for catalog in calib_dir.glob("*catalog*"):
-            os.remove(catalog)
-        cprint(f"Science target '{readout.name}' detected! Removing catalogs...", "y")
-
-    mp.mat_autoPipeline(dirRaw=str(raw_dir), dirResult=str(res_dir),
+    cprint(f"Processing {mode_name} reduction of the {band} for tpl_start: {tpl_start}",
+           "lp")
+    mp.mat_autoPipeline(dirRaw=str(raw_dir), dirResult=str(work_dir),
                         dirCalib=str(calib_dir), tplstartsel=tpl_start,
-                        nbCore=6, resol='', paramL=param_L, paramN=param_N,
+                        nbCore=NUMBER_CORES, resol='', paramL=param_L, paramN=param_N,
                         overwrite=0, maxIter=1, skipL=skip_L, skipN=skip_N)
 
     try:
-        rb_folders = res_dir.glob("Iter1/*.rb")
+        # NOTE: A rename is a single syscall, but only works on the same filesystem
+        same_device = work_dir.stat().st_dev == mode_and_band_dir.stat().st_dev
+        rb_folders = sorted(work_dir.glob("Iter1/*.rb"))
         for folder in rb_folders:
             cprint(f"Moving folder {folder.name}...", "g")
             if (mode_and_band_dir / folder.name).exists():
                 shutil.rmtree(mode_and_band_dir / folder.name)
-            shutil.move(folder, mode_and_band_dir)
+            if same_device:
+                os.replace(folder, mode_and_band_dir / folder.name)
+            else:
+                shutil.move(folder, mode_and_band_dir)
 
         if rb_folders:
             cprint(f"Moving folders to directory {mode_and_band_dir.name}...",
@@ -209,21 +335,33 @@ def reduce_mode_and_band(raw_dir: Path, calib_dir: Path, res_dir: Path,
     except Exception:
         cprint(f"Moving of files to {mode_and_band_dir.name} failed!", "r")
 
-    for folder in mode_and_band_dir.glob("*.rb"):
-        cprint(f"Plotting files of folder {folder.name}...", "g")
-        for fits_file in get_fits_by_tag(folder, "RAW_INT"):
-            plot_fits = Plotter([fits_file],
-                                save_path=(mode_and_band_dir / folder.name))
-            plot_fits.add_cphase().add_vis().plot(save=True)
-
     cprint(f"{'':-^50}", "lg")
-    cprint(f"Executed the {mode} reduction for the {band} in"
+    cprint(f"Executed the {mode_name} reduction for the {band} of {tpl_start} in"
            f" {datetime.timedelta(seconds=(time.perf_counter()-start_time))}"
            "hh:mm:ss",
            "lg")
     cprint(f"{'':-^50}", "lg")
 
 
+def remove_old_reductions(trash_dir: Path) -> None:
+    """Deletes the old reductions moved to the trash directory, including the ones left
+    over by earlier runs that were interrupted
+
+    Parameters
+    ----------
+    trash_dir: Path
+    """
+    for old_res_dir in trash_dir.iterdir():
+        try:
+            shutil.rmtree(old_res_dir)
+        # NOTE: Another reduction might be deleting the same directory concurrently
+        except FileNotFoundError:
+            continue
+        # TODO: Make logger here
+        except OSError as error:
+            cprint(f"Deleting old reduction {old_res_dir.name} failed: {error}", "r")
+
+
 def reduce(root_dir: Path, instrument_dir: Path,
            target_dir: Path, array: str,
            resolution: Optional[str] = "low"):
@@ -255,33 +393,53 @@ def reduce(root_dir: Path, instrument_dir: Path,
 
     res_dir = Path(root_dir, instrument_dir, "products", target_dir).resolve()
 
-    if not res_dir.exists():
-        res_dir.mkdir(parents=True)
-
     # TODO: Add in the option to not remove old reduction and make new one take an
     # addional tag after its name
+    # NOTE: Moving the old reduction out of 'products' is a single syscall, the (slow)
+    # recursive deletion then runs in the background while the reduction proceeds
+    trash_dir = Path(root_dir, instrument_dir, "old_reductions").resolve()
+    trash_dir.mkdir(exist_ok=True)
+    if res_dir.exists():
+        try:
+            os.rename(res_dir, trash_dir / f"{res_dir.name}.{time.time_ns()}")
+            cprint("Cleaning up old reduction...", "y")
+
+        # TODO: Make logger here
+        except Exception:
+            cprint("Cleaning up failed!", "y")
+    threading.Thread(target=remove_old_reductions, args=(trash_dir,)).start()
+    res_dir.mkdir(parents=True, exist_ok=True)
+
+    work_dirs = {}
+    for tpl_start, readout in sorted(get_readouts_by_tpl(raw_dir).items()):
+        work_dir = res_dir / "tmp" / tpl_start.replace(":", "_")
+        prepare_calib_dir(calib_dir, work_dir / "calib_files",
+                          prepare_catalogs(readout))
+        work_dirs[tpl_start] = work_dir
+
+    tasks = [(tpl_start, mode, band)
+             for tpl_start in work_dirs for mode in MODES for band in BANDS]
+
+    # NOTE: Every 'mat_autoPipeline' call already runs on 'NUMBER_CORES'
+    max_workers = max(1, (os.cpu_count() or 1) // NUMBER_CORES)
     try:
-        folders = res_dir.glob("*")
-        for folder in folders:
-            if folder.exists():
-                shutil.rmtree(folder)
-        cprint("Cleaning up old reduction...", "y")
-
-    # TODO: Make logger here
-    except Exception:
-        cprint("Cleaning up failed!", "y")
-
-    for tpl_start in sorted(list(get_tpl_starts(raw_dir))):
-        cprint(f"{'':-^50}", "lg")
-        cprint(f"Reducing data of tpl_start: {tpl_start}", "g")
-        cprint(f"{'':-^50}", "lg")
-        for mode in ["coherent", "incoherent"]:
-            cprint(f"Processing {mode} reduction...", "lp")
-            cprint(f"{'':-^50}", "lg")
-            for band in ["lband", "nband"]:
-                reduce_mode_and_band(raw_dir, calib_dir, res_dir, array,
-                                     resolution=resolution, mode=mode, band=band,
-                                     tpl_start=tpl_start)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(reduce_mode_and_band, raw_dir,
+                                       work_dirs[tpl_start] / "calib_files", res_dir,
+                                       work_dirs[tpl_start] / mode.name.lower() / band,
+                                       array,
+                                       mode=mode, band=band, tpl_start=tpl_start,
+                                       resolution=resolution)
+                       for tpl_start, mode, band in tasks]
+            for future in as_completed(futures):
+                future.result()
+    finally:
+        shutil.rmtree(res_dir / "tmp", ignore_errors=True)
+
+    cprint("Plotting reduced files...", "g")
+    plot_fits_files([(fits_file, folder)
+                     for folder in sorted(res_dir.glob("*/*/*.rb"))
+                     for fits_file in get_fits_by_tag(folder, "RAW_INT")])
 
     execution_time = time.perf_counter()-overall_start_time
     cprint(f"{datetime.timedelta(seconds=execution_time)} hh:mm:ss", "lg")
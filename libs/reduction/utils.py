@@ -22,18 +22,33 @@ def cprint(message: str, c: Optional[str] = None) -> None:
     else:
         print(message)
 
-def split_fits(folder: Path, tag: str):
+def split_fits(folder: Path, tag: str, fits_files: Optional[List[Path]] = None):
     """Searches a folder for a tag and returns the non-chopped
-    and chopped (.fits)-files"""
-    unchopped_fits = get_fits_by_tag(folder, tag)
+    and chopped (.fits)-files. If the folder's (.fits)-files are already known, they
+    can be passed to avoid globbing the folder again"""
+    if fits_files is None:
+        unchopped_fits = get_fits_by_tag(folder, tag)
+    else:
+        unchopped_fits = filter_fits_by_tag(fits_files, tag)
     if len(unchopped_fits) == 6:
         return unchopped_fits[:4], unchopped_fits[4:]
     return unchopped_fits, None
 
 
+def filter_fits_by_tag(fits_files: List[Path], tag: str):
+    """Filters (.fits)-files for a tag and returns the ones matching it"""
+    return sorted([fits_file for fits_file in fits_files if tag in fits_file.name],
+                  key=lambda x: x.name[-8:])
+
+
 def get_fits_by_tag(folder: Path, tag: str):
     """Searches a folder for a tag and returns the (.fits)-files matching it"""
-    return sorted(folder.glob(f"*{tag}*.fits"), key=lambda x: x.name[-8:])
+    if not os.path.isdir(folder):
+        return []
+    with os.scandir(folder) as entries:
+        fits_files = [Path(entry.path) for entry in entries
+                      if entry.name.endswith(".fits") and tag in entry.name[:-5]]
+    return sorted(fits_files, key=lambda x: x.name[-8:])
 
 
 def check_if_target(target_dir: Path) -> bool:
@@ -1,6 +1,4 @@
-import os
 import sys
-import shutil
 import importlib.util
 import subprocess
 
@@ -38,7 +36,6 @@ setup(
         "jaraco.classes==3.2.3",
         "keyring==23.11.0",
         "kiwisolver==1.4.4",
-        "matadrs==0.1",
         "matplotlib==3.6.2",
         "more-itertools==9.0.0",
         "numpy==1.23.5",
@@ -64,25 +61,6 @@ setup(
         "zipp==3.11.0",
 
         # Direct requirements for matadrs
-        "wget==3.2",
-
+        "mat_tools @ git+https://gitlab.oca.eu/MATISSE/tools@master",
     ]
 )
-
-if importlib.util.find_spec("mat_tools") is None:
-    import wget
-
-    mat_tools_remote = "https://gitlab.oca.eu/MATISSE/tools/-/archive/master/tools-master.zip"
-    reduction_dir = os.path.abspath("src/matadrs/libs/reduction")
-    mat_tools_dir = os.path.join(reduction_dir, "tools-master")
-    zip_file_path = mat_tools_dir+".zip"
-
-    if not os.path.exists(zip_file_path):
-        wget.download(mat_tools_remote, zip_file_path)
-    if not os.path.exists(mat_tools_dir):
-        subprocess.run(["tar", "-xf", zip_file_path], cwd=reduction_dir, check=True)
-
-    subprocess.run([sys.executable, "-m", "pip", "-e", "install", "."], cwd=mat_tools_dir,
-                   check=True)
-    shutil.rm(zip_file_path)
-